@@ -0,0 +1,268 @@
+import hashlib
+import importlib.util
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+# The semantic layer is optional (requirements-semantic.txt); sentence-transformers
+# pulls in torch, so it is only imported when the model is first loaded
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class SentenceEmbedder:
+    """Lazily loaded sentence-transformers model producing unit-norm embeddings"""
+
+    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2", dim: int = 384):
+        self.model_name = model_name
+        self.dim = dim
+        self._model = None
+        self._load_lock = threading.Lock()
+
+    @staticmethod
+    def available() -> bool:
+        return np is not None and importlib.util.find_spec("sentence_transformers") is not None
+
+    def load(self):
+        with self._load_lock:
+            if self._model is None:
+                from sentence_transformers import SentenceTransformer
+                self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    def encode(self, text: str):
+        """Embedding of text, or None if it is empty or too long to embed whole.
+
+        The model silently truncates input past max_seq_length word pieces, so
+        two long texts sharing a prefix would look identical; those are treated
+        as uncacheable instead.
+        """
+        if not text.strip():
+            return None
+        model = self.load()
+        if len(model.tokenizer(text, truncation=False)["input_ids"]) > model.max_seq_length:
+            return None
+        return model.encode(text, normalize_embeddings=True).astype(np.float32)
+
+
+class FileCache:
+    """Response cache: exact-match JSON files (L1) with an optional semantic layer (L2).
+
+    The most recent exact-match entries are also kept in an in-process LRU so
+    repeated requests skip the file stat and JSON parse.
+    """
+
+    def __init__(self, cache_dir: Path, ttl: float, embedder: SentenceEmbedder = None, threshold: float = 0.95,
+                 memory_size: int = 128):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+        # key -> (created, value); a threading lock because the semantic
+        # layer backfills from worker threads
+        self.memory_size = memory_size
+        self._memory = OrderedDict()
+        self._memory_lock = threading.Lock()
+
+        # L2 (semantic) layer: unit embeddings in a memmap plus an append-only
+        # JSON-lines sidecar of {"scope", "created", "response"} records,
+        # row-aligned with the memmap; expired rows are compacted away
+        self.embedder = embedder if embedder is not None and embedder.available() else None
+        self._dim = embedder.dim if self.embedder else 0
+        self.threshold = threshold
+        self.semantic_hits = 0
+        self._vectors_path = self.cache_dir / "semantic.f32"
+        self._records_path = self.cache_dir / "semantic.jsonl"
+        self._vectors = None
+        self._records = []
+        self._lock = threading.Lock()
+        if self.embedder:
+            self._load_semantic()
+
+    @staticmethod
+    def make_key(payload: str) -> str:
+        """SHA-256 of a serialized payload (e.g. a pydantic model_dump_json())"""
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def get(self, key: str):
+        """Return the cached result for key, or None if missing or expired"""
+        now = time.time()
+        with self._memory_lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[0] <= self.ttl:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+        path = self._path(key)
+        try:
+            created = path.stat().st_mtime
+            if now - created > self.ttl:
+                self.misses += 1
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        self._remember(key, created, value)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: dict):
+        self._write_json(self._path(key), value)
+        self._remember(key, time.time(), value)
+
+    def _remember(self, key: str, created: float, value: dict):
+        with self._memory_lock:
+            self._memory[key] = (created, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def get_similar(self, key: str, text: str, scope: str):
+        """L2 lookup: nearest cached prompt within the same scope, if similar enough.
+
+        A hit is backfilled into the exact cache under key.
+        """
+        if not self.embedder or not self._records:
+            return None
+
+        query = self._encode(text)
+        if query is None:
+            return None
+        now = time.time()
+        with self._lock:
+            rows = [
+                i for i, record in enumerate(self._records)
+                if record["scope"] == scope and now - record["created"] <= self.ttl
+            ]
+            if not rows:
+                return None
+
+            scores = self._vectors[rows] @ query
+            best = int(scores.argmax())
+            if scores[best] < self.threshold:
+                return None
+
+            value = self._records[rows[best]]["response"]
+
+        self.semantic_hits += 1
+        self.set(key, value)
+        return value
+
+    def add_similar(self, text: str, scope: str, value: dict):
+        """Record text's embedding so later near-duplicate prompts can reuse value"""
+        if not self.embedder:
+            return
+
+        vector = self._encode(text)
+        if vector is None:
+            return
+        record = {"scope": scope, "created": time.time(), "response": value}
+        with self._lock:
+            if self._compact():
+                self._open_vectors(len(self._records))
+            with open(self._vectors_path, "ab") as f:
+                f.write(vector.tobytes())
+            with open(self._records_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._records.append(record)
+            self._open_vectors(len(self._records))
+
+    def load_embedder(self):
+        """Load the embedding model, disabling the semantic layer if that fails"""
+        embedder = self.embedder
+        if embedder is None:
+            return None
+        try:
+            embedder.load()
+        except Exception:
+            # e.g. the model can't be downloaded; don't retry it on every request
+            self.embedder = None
+            raise
+        return embedder
+
+    def _encode(self, text: str):
+        embedder = self.load_embedder()
+        return embedder.encode(text) if embedder is not None else None
+
+    def _load_semantic(self):
+        self._records = []
+        try:
+            with open(self._records_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self._records.append(json.loads(line))
+                    except ValueError:
+                        break  # torn final line from a crash mid-append
+        except OSError:
+            pass
+
+        # Drop any rows written without a matching record (e.g. crash mid-append)
+        row_bytes = self._dim * 4
+        stored_rows = self._vectors_path.stat().st_size // row_bytes if self._vectors_path.exists() else 0
+        count = min(len(self._records), stored_rows)
+        torn = count != len(self._records) or count != stored_rows
+        self._records = self._records[:count]
+        self._open_vectors(count)
+        if self._compact(force=torn):
+            self._open_vectors(len(self._records))
+
+    def _compact(self, force: bool = False) -> bool:
+        """Rewrite both files without expired rows; returns True if they were rewritten.
+
+        Called with _lock held (or before the cache is shared).
+        """
+        now = time.time()
+        live = [i for i, record in enumerate(self._records) if now - record["created"] <= self.ttl]
+        if len(live) == len(self._records) and not force:
+            return False
+
+        vectors = np.asarray(self._vectors[live]) if live else np.empty((0, self._dim), np.float32)
+        self._records = [self._records[i] for i in live]
+        self._vectors = None
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(vectors.astype(np.float32).tobytes())
+        os.replace(tmp_path, self._vectors_path)
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for record in self._records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self._records_path)
+        return True
+
+    def _open_vectors(self, count: int):
+        if count:
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(count, self._dim))
+        else:
+            self._vectors = None
+
+    def _write_json(self, path: Path, value):
+        """Write value atomically (tmpfile + rename) so readers never see partial JSON"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
@@ -1,20 +1,87 @@
 import os
 import asyncio
+import logging
+import platform
+import queue
 import re
+import shutil
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
+import aiofiles
+import httpx
 from fastapi import FastAPI
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from playwright.async_api import async_playwright
+from pydantic import BaseModel, ConfigDict, Field
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
+
+from cache import FileCache, SentenceEmbedder
 
 # Configuration
 APP_DIR = Path(__file__).parent.resolve()
 OUTPUT_DIR = APP_DIR / "output"
 OUTPUT_DIR.mkdir(exist_ok=True)
 CHROME_PROFILE = str(APP_DIR / "chrome_profile")
+TMPFS_PROFILE = "/dev/shm/chrome_profile"  # RAM-backed working copy (Linux only)
+_PROFILE_IGNORE = shutil.ignore_patterns("Singleton*")  # per-process Chrome locks, never copied
+DEBUG_DUMPS = os.getenv("DEBUG_DUMPS", "1") == "1"  # write last_prompt/last_response.txt
+DEBUG_SEPARATOR = "\n\n" + "=" * 70 + "\n\n"
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+GEMINI_API_URL = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent"
+GEMINI_API_CONCURRENCY = int(os.getenv("GEMINI_API_CONCURRENCY", 4))  # keep under the key's rate limit
+USE_BROWSER = os.getenv("USE_BROWSER", "0" if GEMINI_API_KEY else "1") == "1"  # drive gemini.google.com instead
+GEMINI_URL = "https://gemini.google.com/app"
+AUTH_STATE_FILE = str(APP_DIR / "gemini_auth.json")
+PAGE_POOL_SIZE = int(os.getenv("GEMINI_PAGE_POOL", 3))  # concurrent Gemini chats
+CACHE_DIR = OUTPUT_DIR / "cache"
+CACHE_TTL = int(os.getenv("GEMINI_CACHE_TTL", 7 * 24 * 3600))  # seconds
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("GEMINI_SEMANTIC_THRESHOLD", 0.95))  # cosine similarity
+
+# Gemini DOM selectors
+CHAT_INPUT_SELECTOR = "div[contenteditable='true']"
+RESPONSE_SELECTOR = "[data-message-author-role='model'], model-response, [class*='model-response']"
+GENERATION_DONE_JS = """() => !document.querySelector("button[aria-label*='Stop']")"""
+COUNT_RESPONSES_JS = """selector => document.querySelectorAll(selector).length"""
+NEW_RESPONSE_JS = """({ selector, previous }) => document.querySelectorAll(selector).length > previous"""
 
-app = FastAPI()
+# Resolves with the last response's text once there are more than `previous`
+# responses and the Stop button is gone, re-checking only when the DOM
+# changes; resolves null on timeout
+WAIT_FOR_RESPONSE_JS = """
+    ({ selector, previous, timeout }) => new Promise(resolve => {
+        let timer = null;
+        const check = () => {
+            const elems = document.querySelectorAll(selector);
+            const stop = document.querySelector("button[aria-label*='Stop']");
+            if (elems.length > previous && !stop) {
+                finish(elems[elems.length - 1].innerText);
+            }
+        };
+        const obs = new MutationObserver(check);
+        const finish = (result) => {
+            obs.disconnect();
+            clearTimeout(timer);
+            resolve(result);
+        };
+        timer = setTimeout(() => finish(null), timeout);
+        obs.observe(document.body, { childList: true, subtree: true, characterData: true });
+    })
+"""
+
+# Logging: handlers only enqueue records; a listener thread does the stdout writes
+logger = logging.getLogger("gen")
+logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+logger.propagate = False
+_log_queue = queue.Queue(-1)
+logger.addHandler(QueueHandler(_log_queue))
+_log_stream = logging.StreamHandler()
+_log_stream.setFormatter(logging.Formatter("%(message)s"))
+_log_listener = QueueListener(_log_queue, _log_stream)
+
+app = FastAPI(default_response_class=ORJSONResponse)
+response_cache = FileCache(CACHE_DIR, CACHE_TTL, SentenceEmbedder(), SEMANTIC_CACHE_THRESHOLD)
+_background_tasks = set()
 
 app.add_middleware(
     CORSMiddleware,
@@ -25,18 +92,22 @@ app.add_middleware(
 
 # Request Model
 class GenerateRequest(BaseModel):
+    model_config = ConfigDict(frozen=True, str_max_length=100_000)
+    
     title_prompt: str
     desc_prompt: str
     bullet_prompt: str
     title_data: str = ""
     desc_data: str = ""
     bullet_data: str = ""
-    title_count: int = 5
-    desc_count: int = 5
-    bullet_count: int = 8
-    title_length: int = 100
-    desc_length: int = 300
-    bullet_length: int = 80
+    title_count: int = Field(5, ge=1, le=50)
+    desc_count: int = Field(5, ge=1, le=50)
+    bullet_count: int = Field(8, ge=1, le=50)
+    title_length: int = Field(100, ge=1, le=5000)
+    desc_length: int = Field(300, ge=1, le=5000)
+    bullet_length: int = Field(80, ge=1, le=5000)
+    no_cache: bool = False
+    semantic_cache: bool = True
 
 
 @app.get("/")
@@ -45,35 +116,69 @@ async def serve_dashboard():
     html_file = APP_DIR / "dashboard.html"
     if html_file.exists():
         return FileResponse(html_file)
-    return JSONResponse({"error": "Dashboard not found"}, status_code=404)
+    return ORJSONResponse({"error": "Dashboard not found"}, status_code=404)
 
 
 @app.post("/generate")
 async def generate_content(request: GenerateRequest):
-    """Generate content using Gemini via Playwright"""
+    """Generate content using Gemini (API, or Playwright when USE_BROWSER=1)"""
     
-    print("\n" + "="*70)
-    print("🎯 NEW CONTENT GENERATION REQUEST")
-    print("="*70)
-    print(f"📊 Requesting: {request.title_count} titles, {request.desc_count} descriptions, {request.bullet_count} bullets")
-    print(f"📏 Lengths: Title={request.title_length}, Desc={request.desc_length}, Bullet={request.bullet_length}")
+    logger.info("\n" + "="*70)
+    logger.info("🎯 NEW CONTENT GENERATION REQUEST")
+    logger.info("="*70)
+    logger.info(f"📊 Requesting: {request.title_count} titles, {request.desc_count} descriptions, {request.bullet_count} bullets")
+    logger.info(f"📏 Lengths: Title={request.title_length}, Desc={request.desc_length}, Bullet={request.bullet_length}")
     
     try:
+        cache_key = FileCache.make_key(request.model_dump_json(exclude={"no_cache", "semantic_cache"}))
+        semantic_text, semantic_scope = semantic_cache_entry(request)
+        if not request.no_cache:
+            cached = await asyncio.to_thread(response_cache.get, cache_key)
+            if cached is not None:
+                logger.info(f"⚡ Cache hit ({response_cache.hits} hits / {response_cache.misses} misses)")
+                return ORJSONResponse(cached)
+            
+            if request.semantic_cache:
+                try:
+                    cached = await asyncio.to_thread(response_cache.get_similar, cache_key, semantic_text, semantic_scope)
+                except Exception as e:
+                    # The semantic layer is best-effort; any failure is just a miss
+                    logger.warning(f"⚠️  Semantic cache lookup failed: {e}")
+                    cached = None
+                if cached is not None:
+                    logger.info(f"⚡ Semantic cache hit ({response_cache.semantic_hits} total)")
+                    return ORJSONResponse(cached)
+        
         result = await generate_via_gemini(request)
         
         if result["success"]:
-            print(f"\n✅ Generation complete!")
-            print(f"   Generated: {len(result['titles'])} titles, {len(result['descriptions'])} descriptions, {len(result['bullets'])} bullets")
-            return JSONResponse(result)
+            # Only complete replies are worth caching; a placeholder-padded
+            # result would be served back for the whole TTL
+            complete = (
+                len(result["titles"]) >= request.title_count
+                and len(result["descriptions"]) >= request.desc_count
+                and len(result["bullets"]) >= request.bullet_count
+            )
+            fill_missing_items(result, request)
+            
+            logger.info(f"\n✅ Generation complete!")
+            logger.info(f"   Generated: {len(result['titles'])} titles, {len(result['descriptions'])} descriptions, {len(result['bullets'])} bullets")
+            if complete:
+                try:
+                    await asyncio.to_thread(response_cache.set, cache_key, result)
+                except OSError as e:
+                    logger.warning(f"⚠️  Failed to cache response: {e}")
+                run_in_background(response_cache.add_similar, semantic_text, semantic_scope, result)
+            else:
+                logger.warning("⚠️  Reply was missing items; not caching it")
+            return ORJSONResponse(result)
         else:
-            print("\n❌ Generation failed")
-            return JSONResponse(result, status_code=500)
+            logger.error("\n❌ Generation failed")
+            return ORJSONResponse(result, status_code=500)
             
     except Exception as e:
-        print(f"\n❌ Server error: {e}")
-        import traceback
-        traceback.print_exc()
-        return JSONResponse({
+        logger.exception(f"\n❌ Server error: {e}")
+        return ORJSONResponse({
             "success": False,
             "error": str(e),
             "titles": [],
@@ -82,144 +187,448 @@ async def generate_content(request: GenerateRequest):
         }, status_code=500)
 
 
-async def generate_via_gemini(request: GenerateRequest) -> dict:
-    """Launch browser and generate content from Gemini"""
+def run_in_background(func, *args):
+    """Run a blocking call in a worker thread without holding up the response"""
+    task = asyncio.create_task(asyncio.to_thread(func, *args))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    task.add_done_callback(log_background_error)
+
+
+def log_background_error(task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"❌ Background task failed: {task.exception()}")
+
+
+def semantic_cache_entry(request: GenerateRequest) -> tuple:
+    """Text to embed for the semantic cache, and the scope it may match within.
+
+    Only the reference data is embedded, since that is what tells catalog
+    requests apart; the prompts and count/length settings must match exactly.
+    """
+    text = "\n".join([request.title_data, request.desc_data, request.bullet_data])
+    scope = FileCache.make_key(request.model_dump_json(include={
+        "title_prompt", "desc_prompt", "bullet_prompt",
+        "title_count", "desc_count", "bullet_count",
+        "title_length", "desc_length", "bullet_length",
+    }))
+    return text, scope
+
+
+@app.on_event("startup")
+async def start_backend():
+    """Open the Gemini API client, or the browser pool when USE_BROWSER=1"""
+    _log_listener.start()
+    if response_cache.embedder:
+        # Load the embedding model off the request path
+        run_in_background(response_cache.load_embedder)
+    if USE_BROWSER:
+        await start_browser()
+    else:
+        logger.info(f"🔌 Using Gemini API ({GEMINI_MODEL})")
+        app.state.http = httpx.AsyncClient(
+            timeout=httpx.Timeout(120.0),
+            limits=httpx.Limits(max_connections=GEMINI_API_CONCURRENCY),
+        )
+        app.state.api_slots = asyncio.Semaphore(GEMINI_API_CONCURRENCY)
+
+
+@app.on_event("shutdown")
+async def stop_backend():
+    """Release the API client or browser"""
+    if USE_BROWSER:
+        await stop_browser()
+    else:
+        await app.state.http.aclose()
+    _log_listener.stop()
+
+
+async def start_browser():
+    """Launch Chrome once and warm a pool of signed-in Gemini contexts"""
+    recover_chrome_profile()
+    os.makedirs(CHROME_PROFILE, exist_ok=True)
+    app.state.playwright = await async_playwright().start()
+    chromium = app.state.playwright.chromium
     
-    async with async_playwright() as p:
-        print("🚀 Launching Chrome...")
-        os.makedirs(CHROME_PROFILE, exist_ok=True)
-        
+    logger.info("🚀 Launching Chrome...")
+    app.state.browser = await launch_chrome(chromium.launch)
+    
+    # Every pooled context starts from the saved session snapshot; only fall
+    # back to the persistent profile (and a possible manual sign-in) without one
+    if await auth_state_is_valid():
+        logger.info("✅ Reusing saved Gemini session")
+    else:
+        await capture_auth_state(chromium)
+    
+    # One chat per context; checking a context out of the queue gives exclusive use
+    app.state.contexts = asyncio.Queue()
+    contexts = [
+        await app.state.browser.new_context(storage_state=AUTH_STATE_FILE)
+        for _ in range(PAGE_POOL_SIZE)
+    ]
+    pages = [await context.new_page() for context in contexts]
+    await asyncio.gather(*(open_gemini_chat(page) for page in pages))
+    for context in contexts:
+        app.state.contexts.put_nowait(context)
+    logger.info(f"✅ Browser ready with {PAGE_POOL_SIZE} Gemini context(s)")
+
+
+async def stop_browser():
+    """Save the current session, then close the shared browser and Playwright driver"""
+    if app.state.browser.contexts:
         try:
-            context = await p.chromium.launch_persistent_context(
-                CHROME_PROFILE,
-                headless=False,
-                channel="chrome",
-                args=["--disable-blink-features=AutomationControlled"],
-                slow_mo=50
-            )
-        except:
-            context = await p.chromium.launch_persistent_context(
-                CHROME_PROFILE,
-                headless=False,
-                args=["--disable-blink-features=AutomationControlled", "--no-sandbox"],
-                slow_mo=50
-            )
+            await app.state.browser.contexts[0].storage_state(path=AUTH_STATE_FILE)
+        except Exception as e:
+            logger.warning(f"⚠️  Failed to save Gemini session: {e}")
+    await app.state.browser.close()
+    await app.state.playwright.stop()
 
-        pages = context.pages
-        page = pages[0] if pages else await context.new_page()
 
-        titles = []
-        descriptions = []
-        bullets = []
+async def auth_state_is_valid() -> bool:
+    """Check that the saved storage_state snapshot still opens a signed-in chat"""
+    if not os.path.exists(AUTH_STATE_FILE):
+        return False
+    
+    context = await app.state.browser.new_context(storage_state=AUTH_STATE_FILE)
+    try:
+        page = await context.new_page()
+        await page.goto(GEMINI_URL, timeout=120000, wait_until="domcontentloaded")
+        await page.wait_for_selector(CHAT_INPUT_SELECTOR, state="visible", timeout=15000)
+        return True
+    except PlaywrightTimeoutError:
+        logger.warning("⚠️  Saved Gemini session has expired")
+        return False
+    finally:
+        await context.close()
+
 
+async def capture_auth_state(chromium):
+    """Sign in with the persistent chrome_profile/ and snapshot its storage_state"""
+    logger.info("🔑 Loading Gemini session from chrome_profile/...")
+    profile_dir = await asyncio.to_thread(stage_chrome_profile)
+    launched = False
+    try:
+        profile_context = await launch_chrome(chromium.launch_persistent_context, profile_dir)
+        launched = True
         try:
-            # Navigate to Gemini
-            print("📱 Navigating to Gemini...")
-            await page.goto("https://gemini.google.com/app", timeout=120000, wait_until="domcontentloaded")
-            await asyncio.sleep(3)
-            
-            # Check if logged in
-            chat_check = await page.query_selector("div[contenteditable='true']")
-            if chat_check:
-                print("✅ Already signed in!")
-                await asyncio.sleep(2)
-            else:
-                print("⚠️  Sign in required - waiting 90 seconds...")
-                await asyncio.sleep(90)
-            
-            await page.wait_for_selector("div[contenteditable='true']", timeout=60000)
+            pages = profile_context.pages
+            page = pages[0] if pages else await profile_context.new_page()
+            await open_gemini_chat(page)
+            await profile_context.storage_state(path=AUTH_STATE_FILE)
+        finally:
+            await profile_context.close()
+    finally:
+        if profile_dir != CHROME_PROFILE:
+            await asyncio.to_thread(unstage_chrome_profile, profile_dir, launched)
 
-            # Build the comprehensive prompt
-            prompt = build_generation_prompt(request)
-            
-            # Save prompt for debugging
-            debug_file = OUTPUT_DIR / "last_prompt.txt"
-            with open(debug_file, "w", encoding="utf-8") as f:
-                f.write(prompt)
-            print(f"💾 Saved prompt to: {debug_file}")
-            
-            # Send prompt to Gemini
-            print("💬 Sending prompt to Gemini...")
-            await send_prompt_to_gemini(page, prompt)
-            
-            # Wait for response
-            print("⏳ Waiting for Gemini response...")
-            await asyncio.sleep(35)  # Give time for generation
-            
-            # Extract response
-            response_text = await extract_gemini_response(page)
-            
-            if not response_text:
-                raise Exception("Empty response from Gemini")
-            
-            print(f"📝 Response length: {len(response_text)} characters")
-            
-            # Save response for debugging
-            debug_file = OUTPUT_DIR / "last_response.txt"
-            with open(debug_file, "w", encoding="utf-8") as f:
-                f.write(response_text)
-            print(f"💾 Saved response to: {debug_file}")
-            
-            # Parse response
-            titles, descriptions, bullets = parse_gemini_response(
-                response_text,
-                request.title_count,
-                request.desc_count,
-                request.bullet_count
-            )
-            
-            # Fill missing items with defaults
-            while len(titles) < request.title_count:
-                titles.append(f"Generated Title {len(titles) + 1}")
-            while len(descriptions) < request.desc_count:
-                descriptions.append(f"Generated Description {len(descriptions) + 1}")
-            while len(bullets) < request.bullet_count:
-                bullets.append(f"Generated Bullet Point {len(bullets) + 1}")
 
-        except Exception as e:
-            print(f"❌ Generation error: {e}")
-            import traceback
-            traceback.print_exc()
-        finally:
+def stage_chrome_profile() -> str:
+    """Copy chrome_profile/ into tmpfs on Linux and return the directory to launch with"""
+    if platform.system() != "Linux" or not os.path.isdir("/dev/shm"):
+        return CHROME_PROFILE
+    # Start from an empty directory: leftovers from an earlier (possibly crashed)
+    # run, such as SQLite -journal/-wal files, must not mix with the fresh copy
+    shutil.rmtree(TMPFS_PROFILE, ignore_errors=True)
+    try:
+        shutil.copytree(CHROME_PROFILE, TMPFS_PROFILE, symlinks=True, ignore=_PROFILE_IGNORE)
+    except OSError as e:
+        shutil.rmtree(TMPFS_PROFILE, ignore_errors=True)
+        logger.warning(f"⚠️  Could not copy profile to {TMPFS_PROFILE}, using disk profile: {e}")
+        return CHROME_PROFILE
+    return TMPFS_PROFILE
+
+
+def unstage_chrome_profile(profile_dir: str, persist: bool):
+    """Write a tmpfs profile back to chrome_profile/ (if persist), then delete it.
+
+    Live session cookies shouldn't linger in shared memory, but the RAM copy is
+    the only up-to-date one until the copy-back succeeds, so it is kept if that
+    fails.
+    """
+    if persist:
+        try:
+            replace_chrome_profile(profile_dir)
+        except OSError as e:
+            logger.error(f"❌ Could not save profile back to {CHROME_PROFILE}, kept it at {profile_dir}: {e}")
+            return
+    shutil.rmtree(profile_dir, ignore_errors=True)
+
+
+def replace_chrome_profile(src: str):
+    """Swap a copy of src in as chrome_profile/.
+
+    src is copied to a sibling directory first and moved into place with
+    renames, so a failed copy leaves the old profile untouched and files
+    Chrome deleted in src (e.g. a committed SQLite -journal) don't survive.
+    """
+    staged, previous = CHROME_PROFILE + ".new", CHROME_PROFILE + ".old"
+    shutil.rmtree(staged, ignore_errors=True)
+    try:
+        shutil.copytree(src, staged, symlinks=True, ignore=_PROFILE_IGNORE)
+    except OSError:
+        shutil.rmtree(staged, ignore_errors=True)
+        raise
+    shutil.rmtree(previous, ignore_errors=True)
+    os.rename(CHROME_PROFILE, previous)
+    os.rename(staged, CHROME_PROFILE)
+    shutil.rmtree(previous, ignore_errors=True)
+
+
+def recover_chrome_profile():
+    """Finish a chrome_profile/ swap interrupted between its two renames"""
+    previous = CHROME_PROFILE + ".old"
+    if not os.path.exists(CHROME_PROFILE) and os.path.isdir(previous):
+        os.rename(previous, CHROME_PROFILE)
+
+
+async def launch_chrome(launch, *args, **kwargs):
+    """Launch installed Chrome, falling back to bundled Chromium"""
+    try:
+        return await launch(
+            *args,
+            headless=False,
+            channel="chrome",
+            args=["--disable-blink-features=AutomationControlled"],
+            slow_mo=50,
+            **kwargs
+        )
+    except:
+        return await launch(
+            *args,
+            headless=False,
+            args=["--disable-blink-features=AutomationControlled", "--no-sandbox"],
+            slow_mo=50,
+            **kwargs
+        )
+
+
+async def open_gemini_chat(page):
+    """Navigate page to a fresh Gemini chat, waiting for sign-in if needed"""
+    logger.info("📱 Navigating to Gemini...")
+    await page.goto(GEMINI_URL, timeout=120000, wait_until="domcontentloaded")
+    
+    # Check if logged in (chat box only renders for a signed-in session)
+    try:
+        await page.wait_for_selector(CHAT_INPUT_SELECTOR, state="visible", timeout=15000)
+        logger.info("✅ Already signed in!")
+    except PlaywrightTimeoutError:
+        logger.warning("⚠️  Sign in required - waiting up to 90 seconds...")
+        await page.wait_for_selector(CHAT_INPUT_SELECTOR, state="visible", timeout=90000)
+
+
+async def release_context(context):
+    """Reset the context's page to a fresh chat and return it to the pool.
+
+    A context whose reset failed may still show the last reply, so it is
+    closed and replaced by a new one from the saved session.
+    """
+    try:
+        page = context.pages[0] if context.pages else await context.new_page()
+        await open_gemini_chat(page)
+    except Exception as e:
+        logger.warning(f"⚠️  Failed to reset Gemini page, replacing its context: {e}")
+        try:
             await context.close()
+        except Exception:
+            pass
+        try:
+            context = await app.state.browser.new_context(storage_state=AUTH_STATE_FILE)
+        except Exception as e:
+            logger.error(f"❌ Failed to replace Gemini context, pool is one smaller: {e}")
+            return
+        try:
+            await open_gemini_chat(await context.new_page())
+        except Exception as e:
+            logger.warning(f"⚠️  Failed to open Gemini chat in new context: {e}")
+    app.state.contexts.put_nowait(context)
 
-        return {
-            "success": len(titles) > 0 or len(descriptions) > 0 or len(bullets) > 0,
-            "titles": titles[:request.title_count],
-            "descriptions": descriptions[:request.desc_count],
-            "bullets": bullets[:request.bullet_count]
-        }
 
+async def generate_via_gemini(request: GenerateRequest) -> dict:
+    """Generate content from Gemini via the API (or browser when USE_BROWSER=1)"""
+    
+    titles = []
+    descriptions = []
+    bullets = []
+    success = False
 
-def build_generation_prompt(request: GenerateRequest) -> str:
-    """Build comprehensive prompt for Gemini"""
+    try:
+        if USE_BROWSER:
+            titles, descriptions, bullets = await generate_combined(request)
+        else:
+            try:
+                titles, descriptions, bullets = await generate_split(request)
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                logger.warning(f"⚠️  Parallel generation failed ({e}), retrying with a combined prompt...")
+                titles, descriptions, bullets = await generate_combined(request)
+        success = True
+
+    except Exception as e:
+        logger.exception(f"❌ Generation error: {e}")
+
+    # Items are returned as parsed; generate_content fills in placeholders
+    return {
+        "success": success,
+        "titles": titles[:request.title_count],
+        "descriptions": descriptions[:request.desc_count],
+        "bullets": bullets[:request.bullet_count]
+    }
+
+
+class EmptyResponseError(Exception):
+    """Gemini answered but the reply contained no text"""
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether a failed Gemini request might succeed if sent again"""
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return isinstance(error, (httpx.TransportError, EmptyResponseError))
+
+
+def fill_missing_items(result: dict, request: GenerateRequest):
+    """Pad each list in result with placeholder items up to the requested count"""
+    titles, descriptions, bullets = result["titles"], result["descriptions"], result["bullets"]
+    while len(titles) < request.title_count:
+        titles.append(f"Generated Title {len(titles) + 1}")
+    while len(descriptions) < request.desc_count:
+        descriptions.append(f"Generated Description {len(descriptions) + 1}")
+    while len(bullets) < request.bullet_count:
+        bullets.append(f"Generated Bullet Point {len(bullets) + 1}")
+
+
+async def generate_combined(request: GenerateRequest) -> tuple:
+    """Ask for titles, descriptions and bullets in a single prompt"""
+    
+    # Build the comprehensive prompt
+    prompt = build_generation_prompt(request)
+    await save_debug_file("last_prompt.txt", prompt)
+    
+    # Send prompt to Gemini
+    logger.info("💬 Sending prompt to Gemini...")
+    if USE_BROWSER:
+        response_text = await ask_gemini_browser(prompt)
+    else:
+        response_text = await call_gemini(prompt)
+    
+    if not response_text:
+        raise EmptyResponseError("Empty response from Gemini")
     
-    prompt = f"""You are an expert e-commerce content writer. Generate product content based on the following instructions.
+    logger.info(f"📝 Response length: {len(response_text)} characters")
+    await save_debug_file("last_response.txt", response_text)
+    
+    # Parse response
+    return parse_gemini_response(
+        response_text,
+        request.title_count,
+        request.desc_count,
+        request.bullet_count
+    )
 
-**PROMPTS (How to write):**
-- Title Prompt: {request.title_prompt}
-- Description Prompt: {request.desc_prompt}
-- Bullet Prompt: {request.bullet_prompt}
 
-**REFERENCE DATA (What to base content on):**
-"""
+async def generate_split(request: GenerateRequest) -> tuple:
+    """Ask for titles, descriptions and bullets as three concurrent API calls"""
     
-    if request.title_data:
-        prompt += f"\nTitle Reference Data:\n{request.title_data}\n"
+    prompts = [
+        build_titles_prompt(request),
+        build_descs_prompt(request),
+        build_bullets_prompt(request),
+    ]
+    await save_debug_file("last_prompt.txt", DEBUG_SEPARATOR.join(prompts))
     
-    if request.desc_data:
-        prompt += f"\nDescription Reference Data:\n{request.desc_data}\n"
+    logger.info("💬 Sending 3 prompts to Gemini in parallel...")
+    tasks = [asyncio.create_task(call_gemini(prompt)) for prompt in prompts]
+    try:
+        responses = await asyncio.gather(*tasks)
+    except BaseException:
+        # Don't leave the sibling calls holding API slots the fallback needs
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
     
-    if request.bullet_data:
-        prompt += f"\nBullet Reference Data:\n{request.bullet_data}\n"
+    if not all(responses):
+        raise EmptyResponseError("Empty response from Gemini")
     
-    prompt += f"""
+    logger.info(f"📝 Response lengths: {', '.join(str(len(text)) for text in responses)} characters")
+    await save_debug_file("last_response.txt", DEBUG_SEPARATOR.join(responses))
+    
+    # Each response holds a single section, so its items can be scanned directly
+    titles_text, descs_text, bullets_text = responses
+    return (
+        parse_numbered_items(titles_text, "Title", request.title_count, 10),
+        parse_numbered_items(descs_text, "Description", request.desc_count, 20),
+        parse_numbered_items(bullets_text, "Bullet", request.bullet_count, 10),
+    )
+
+
+async def save_debug_file(name: str, text: str):
+    """Write text to output/<name> when DEBUG_DUMPS is on"""
+    if not DEBUG_DUMPS:
+        return
+    debug_file = OUTPUT_DIR / name
+    async with aiofiles.open(debug_file, "w", encoding="utf-8") as f:
+        await f.write(text)
+    logger.info(f"💾 Saved debug file: {debug_file}")
+
+
+async def call_gemini(prompt: str) -> str:
+    """Send prompt to the Gemini generateContent API and return the reply text"""
+    async with app.state.api_slots:
+        response = await app.state.http.post(
+            GEMINI_API_URL,
+            headers={"x-goog-api-key": GEMINI_API_KEY},
+            json={"contents": [{"parts": [{"text": prompt}]}]},
+        )
+    response.raise_for_status()
+    
+    candidates = response.json().get("candidates") or []
+    if not candidates:
+        return ""
+    parts = candidates[0].get("content", {}).get("parts", [])
+    # API replies carry no web-UI chrome, so only whitespace is normalized;
+    # clean_response_text would delete phrases like "double-check" from real copy
+    return collapse_whitespace("".join(part.get("text", "") for part in parts))
+
+
+async def ask_gemini_browser(prompt: str) -> str:
+    """Send prompt through a pooled gemini.google.com chat and return the reply text"""
+    
+    context = await app.state.contexts.get()
+    try:
+        page = context.pages[0] if context.pages else await context.new_page()
+        await page.wait_for_selector(CHAT_INPUT_SELECTOR, state="visible", timeout=60000)
+        # Responses already on the page (e.g. after a failed reset) must not be
+        # mistaken for the reply to this prompt
+        previous = await page.evaluate(COUNT_RESPONSES_JS, RESPONSE_SELECTOR)
+        await send_prompt_to_gemini(page, prompt)
+        
+        # Extract response (waits for generation to finish)
+        return await extract_gemini_response(page, previous)
+    finally:
+        # Start the next fresh chat off the request path
+        task = asyncio.create_task(release_context(context))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+
+_PROMPT_TEMPLATE = """You are an expert e-commerce content writer. Generate product content based on the following instructions.
+
+**PROMPTS (How to write):**
+- Title Prompt: {title_prompt}
+- Description Prompt: {desc_prompt}
+- Bullet Prompt: {bullet_prompt}
+
+**REFERENCE DATA (What to base content on):**
+{references}
 
 **GENERATION REQUIREMENTS:**
-1. Generate EXACTLY {request.title_count} titles, {request.desc_count} descriptions, {request.bullet_count} bullets
-2. Each title should be approximately {request.title_length} characters
-3. Each description should be approximately {request.desc_length} characters
-4. Each bullet should be approximately {request.bullet_length} characters
+1. Generate EXACTLY {title_count} titles, {desc_count} descriptions, {bullet_count} bullets
+2. Each title should be approximately {title_length} characters
+3. Each description should be approximately {desc_length} characters
+4. Each bullet should be approximately {bullet_length} characters
 5. Use the prompts to guide your writing style
 6. Use the reference data to understand what type of content to create
 
@@ -250,14 +659,105 @@ Bullet 2: [Write actual bullet here]
 - Base content on the reference data provided
 
 Now generate the content. Start with "TITLES:" immediately."""
+
+
+# Split around the reference data so large *_data fields are joined in, not formatted
+_PROMPT_HEADER, _PROMPT_FOOTER = _PROMPT_TEMPLATE.split("{references}")
+
+
+def build_generation_prompt(request: GenerateRequest) -> str:
+    """Build comprehensive prompt for Gemini"""
     
-    return prompt
+    fields = request.__dict__
+    return "".join([
+        _PROMPT_HEADER.format_map(fields),
+        *reference_data_parts(request),
+        _PROMPT_FOOTER.format_map(fields),
+    ])
+
+
+def reference_data_parts(request: GenerateRequest) -> list:
+    """Reference-data blocks shared by every prompt (empty ones are omitted)"""
+    parts = []
+    for label, data in (
+        ("Title", request.title_data),
+        ("Description", request.desc_data),
+        ("Bullet", request.bullet_data),
+    ):
+        if data:
+            parts.extend((f"\n{label} Reference Data:\n", data, "\n"))
+    return parts
+
+
+_SECTION_PROMPT_TEMPLATE = """You are an expert e-commerce content writer. Generate product {plural} based on the following instructions.
+
+**PROMPT (How to write):**
+{prompt}
+
+**REFERENCE DATA (What to base content on):**
+{references}
+
+**GENERATION REQUIREMENTS:**
+1. Generate EXACTLY {count} {plural}
+2. Each {singular} should be approximately {length} characters
+3. Use the prompt to guide your writing style
+4. Use the reference data to understand what type of content to create
+
+**CRITICAL OUTPUT FORMAT - FOLLOW EXACTLY:**
+
+{header}
+{label} 1: [Write actual {singular} here]
+{label} 2: [Write actual {singular} here]
+...
+
+**IMPORTANT RULES:**
+- Start IMMEDIATELY with "{header}" followed by numbered items
+- Each item must be on its OWN LINE
+- Use format "{label} 1:", "{label} 2:" for EVERY item
+- Write REAL content - NO placeholders like "[write content here]"
+- Follow the character length guidelines closely
+- Base content on the reference data provided
+
+Now generate the {plural}. Start with "{header}" immediately."""
+
+
+_SECTION_PROMPT_HEADER, _SECTION_PROMPT_FOOTER = _SECTION_PROMPT_TEMPLATE.split("{references}")
+
+
+def build_section_prompt(request: GenerateRequest, label: str, prompt: str, count: int, length: int) -> str:
+    """Build a prompt asking for one content type only"""
+    fields = {
+        "label": label,
+        "singular": label.lower(),
+        "plural": label.lower() + "s",
+        "header": label.upper() + "S:",
+        "prompt": prompt,
+        "count": count,
+        "length": length,
+    }
+    return "".join([
+        _SECTION_PROMPT_HEADER.format_map(fields),
+        *reference_data_parts(request),
+        _SECTION_PROMPT_FOOTER.format_map(fields),
+    ])
+
+
+def build_titles_prompt(request: GenerateRequest) -> str:
+    return build_section_prompt(request, "Title", request.title_prompt, request.title_count, request.title_length)
+
+
+def build_descs_prompt(request: GenerateRequest) -> str:
+    return build_section_prompt(request, "Description", request.desc_prompt, request.desc_count, request.desc_length)
+
+
+def build_bullets_prompt(request: GenerateRequest) -> str:
+    return build_section_prompt(request, "Bullet", request.bullet_prompt, request.bullet_count, request.bullet_length)
 
 
 async def send_prompt_to_gemini(page, prompt: str):
     """Send prompt to Gemini chat"""
     try:
-        chat_box = await page.query_selector("div[contenteditable='true']")
+        chat_box = await page.query_selector(CHAT_INPUT_SELECTOR)
         await chat_box.click()
         await asyncio.sleep(0.5)
         
@@ -280,91 +780,58 @@ async def send_prompt_to_gemini(page, prompt: str):
         
         await asyncio.sleep(1)
         await page.keyboard.press("Enter")
-        print("✅ Prompt sent!")
+        logger.info("✅ Prompt sent!")
         
     except Exception as e:
-        print(f"❌ Failed to send prompt: {e}")
+        logger.error(f"❌ Failed to send prompt: {e}")
         raise
 
 
-async def extract_gemini_response(page) -> str:
-    """Extract Gemini's text response"""
+async def extract_gemini_response(page, previous: int = 0) -> str:
+    """Extract Gemini's text response, ignoring the first `previous` response elements"""
     try:
-        print("⏳ Waiting for response to appear...")
-        await asyncio.sleep(8)
-        
-        # Try multiple selectors
-        response_selectors = [
-            "[data-message-author-role='model']",
-            "model-response",
-            "[class*='model-response']"
-        ]
-        
-        response_elem = None
-        for i in range(120):  # Wait up to 2 minutes
-            for selector in response_selectors:
-                try:
-                    response_elem = await page.query_selector(selector)
-                    if response_elem:
-                        break
-                except:
-                    pass
-            
-            if response_elem:
-                break
-            
-            # Check if response started appearing in page text
-            if i > 10:
-                has_response = await page.evaluate("""
-                    () => {
-                        const allText = document.body.innerText;
-                        return allText.includes('TITLES:') || allText.includes('Title 1:');
-                    }
-                """)
-                
-                if has_response:
-                    print("✅ Response detected in page")
-                    break
-            
-            await asyncio.sleep(1)
-            if i % 15 == 0 and i > 0:
-                print(f"   Still waiting... {i}s")
-        
-        # Wait for completion
-        print("⏳ Waiting for generation to complete...")
-        await asyncio.sleep(5)
+        logger.info("⏳ Waiting for Gemini response...")
+        try:
+            text = await page.evaluate(
+                WAIT_FOR_RESPONSE_JS, {"selector": RESPONSE_SELECTOR, "previous": previous, "timeout": 180000}
+            )
+        except Exception as e:
+            logger.warning(f"⚠️  Response observer failed: {e}")
+            text = None
         
-        for i in range(60):
-            try:
-                stop_button = await page.query_selector("button[aria-label*='Stop']")
-                if not stop_button:
-                    print("✅ Generation complete")
-                    break
-            except:
-                pass
-            await asyncio.sleep(1)
+        if text and len(text) > 50:
+            logger.info("✅ Generation complete")
+            return clean_response_text(text)
         
-        await asyncio.sleep(3)
+        # Fallback: explicit DOM waits
+        logger.warning("⚠️  Response not observed, falling back to DOM waits...")
+        try:
+            await page.wait_for_function(
+                NEW_RESPONSE_JS, arg={"selector": RESPONSE_SELECTOR, "previous": previous}, timeout=120000
+            )
+        except PlaywrightTimeoutError:
+            logger.warning("⚠️  Response element not found, falling back to page text")
         
-        # Extract text from response element
-        if response_elem:
-            text = await response_elem.inner_text()
-            if text and len(text) > 50:
-                return clean_response_text(text)
+        # Wait for completion (Stop button disappears once generation ends)
+        logger.info("⏳ Waiting for generation to complete...")
+        try:
+            await page.wait_for_function(GENERATION_DONE_JS, timeout=180000)
+            logger.info("✅ Generation complete")
+        except PlaywrightTimeoutError:
+            logger.warning("⚠️  Timed out waiting for generation to complete")
         
-        # Fallback: get last response
-        response_elements = await page.query_selector_all("[data-message-author-role='model']")
-        if response_elements:
-            last_response = response_elements[-1]
-            text = await last_response.inner_text()
+        # Extract text from the newest response element
+        response_elements = await page.query_selector_all(RESPONSE_SELECTOR)
+        if len(response_elements) > previous:
+            text = await response_elements[-1].inner_text()
             if text and len(text) > 50:
                 return clean_response_text(text)
         
-        # Last resort: extract from page
+        # Last resort: extract from page (the newest TITLES: is this reply's)
         page_text = await page.evaluate("""
             () => {
                 const bodyText = document.body.innerText;
-                const titlesIndex = bodyText.indexOf('TITLES:');
+                const titlesIndex = bodyText.lastIndexOf('TITLES:');
                 if (titlesIndex !== -1) {
                     return bodyText.substring(titlesIndex);
                 }
@@ -378,30 +845,38 @@ async def extract_gemini_response(page) -> str:
         return ""
         
     except Exception as e:
-        print(f"❌ Error extracting response: {e}")
+        logger.error(f"❌ Error extracting response: {e}")
         return ""
 
 
+# Gemini UI strings that leak into innerText, stripped in one pass
+_CLEANUP_RE = re.compile('|'.join(map(re.escape, [
+    "Gemini can make mistakes",
+    "double-check",
+    "Show drafts",
+    "Copy code",
+    "Use code with caution",
+    "You stopped this response"
+])))
+_NEWLINES_RE = re.compile(r'\n{3,}')
+_SPACES_RE = re.compile(r' {2,}')
+
+
+def collapse_whitespace(text: str) -> str:
+    """Squeeze runs of blank lines and spaces"""
+    text = _NEWLINES_RE.sub('\n\n', text)
+    return _SPACES_RE.sub(' ', text).strip()
+
+
 def clean_response_text(text: str) -> str:
-    """Clean up extracted response"""
+    """Clean up response text scraped from the Gemini web UI"""
     text = text.strip()
     
     # Remove common UI elements
-    cleanup_phrases = [
-        "Gemini can make mistakes",
-        "double-check",
-        "Show drafts",
-        "Copy code",
-        "Use code with caution",
-        "You stopped this response"
-    ]
-    
-    for phrase in cleanup_phrases:
-        text = text.replace(phrase, "")
+    text = _CLEANUP_RE.sub('', text)
     
     # Clean up whitespace
-    text = re.sub(r'\n{3,}', '\n\n', text)
-    text = re.sub(r' {2,}', ' ', text)
+    text = collapse_whitespace(text)
     
     # Extract from TITLES: onwards
     if 'TITLES:' in text:
@@ -411,6 +886,101 @@ def clean_response_text(text: str) -> str:
     return text.strip()
 
 
+# Markdown emphasis, heading and list characters that can wrap item markers
+_MARKUP_CHARS = "*_#>`-"
+
+
+def match_item_marker(tokens: list, i: int, label: str):
+    """Match "<label> N:" starting at tokens[i] (case-insensitive).
+
+    The label, number and colon may be glued together or split by whitespace
+    ("Title 1:", "Title1:", "Title 1 :"), and may be wrapped in markdown
+    ("**Title 1:**", "* **Bullet 2**:"). Returns (N, next_token_index,
+    text_after_colon) or None.
+    """
+    head = tokens[i].lstrip(_MARKUP_CHARS)
+    if not head.lower().startswith(label):
+        return None
+    
+    glued = head
+    for j in range(i, min(i + 3, len(tokens))):
+        if j > i:
+            glued += tokens[j]
+        rest = glued[len(label):]
+        digits = len(rest) - len(rest.lstrip("0123456789"))
+        tail = rest[digits:].lstrip("*_")
+        if digits and tail.startswith(":"):
+            return int(rest[:digits]), j + 1, tail[1:].lstrip("*_")
+        if tail:
+            return None
+    return None
+
+
+def is_list_lead(token: str) -> bool:
+    """True for tokens that can precede an item marker on its line: markup or an "N." list number"""
+    return not token.strip(_MARKUP_CHARS) or (token[:-1].isdigit() and token.endswith("."))
+
+
+def trim_item_words(words: list, next_lead: list = ()) -> list:
+    """Drop markup left dangling at the end of an item.
+
+    next_lead is whatever preceded the next marker on its own line ("1.",
+    "*", "###"); it is dropped only when it is all list markup, so a number
+    that really ends the item ("a pack of 2.") is kept. Trailing pure markup
+    tokens ("**") are always dropped.
+    """
+    if next_lead and len(next_lead) <= len(words) and all(map(is_list_lead, next_lead)):
+        del words[-len(next_lead):]
+    while words and not words[-1].strip(_MARKUP_CHARS):
+        words.pop()
+    return words
+
+
+def parse_numbered_items(section: str, label: str, count: int, min_length: int) -> list:
+    """Collect items 1..count from section in one left-to-right token scan.
+
+    Items may share a line (Gemini's innerText often flattens the list), so
+    the scan works on whitespace-separated tokens rather than lines; joining
+    the tokens back with single spaces also normalizes whitespace. Each
+    token remembers where its line starts so a list number is only stripped
+    when it leads the next marker's line.
+    """
+    
+    key = label.lower()
+    tokens, line_starts = [], []
+    for line in section.splitlines():
+        words = line.split()
+        line_starts.extend([len(tokens)] * len(words))
+        tokens.extend(words)
+    
+    found = {}
+    current, words = None, []
+    i = 0
+    while i < len(tokens):
+        marker = match_item_marker(tokens, i, key)
+        if marker:
+            start = i
+            index, i, remainder = marker
+            if current is not None:
+                found.setdefault(current, trim_item_words(words, tokens[line_starts[start]:start]))
+            current = index
+            words = [remainder] if remainder else []
+            continue
+        if current is not None:
+            words.append(tokens[i])
+        i += 1
+    if current is not None:
+        found.setdefault(current, trim_item_words(words))
+    
+    items = []
+    for i in range(1, count + 1):
+        content = ' '.join(found.get(i, ()))
+        if len(content) > min_length:
+            items.append(content)
+            logger.debug(f"   ✓ {label} {i}: {content[:60]}...")
+    return items
+
+
 def parse_gemini_response(response_text: str, title_count: int, desc_count: int, bullet_count: int) -> tuple:
     """Parse structured response from Gemini"""
     
@@ -419,7 +989,7 @@ def parse_gemini_response(response_text: str, title_count: int, desc_count: int,
     bullets = []
     
     try:
-        print("🔍 Parsing response...")
+        logger.info("🔍 Parsing response...")
         
         # Find section boundaries
         response_upper = response_text.upper()
@@ -428,7 +998,7 @@ def parse_gemini_response(response_text: str, title_count: int, desc_count: int,
         bullets_start = response_upper.find("BULLETS:")
         
         if titles_start == -1:
-            print("⚠️  'TITLES:' section not found")
+            logger.warning("⚠️  'TITLES:' section not found")
             return titles, descriptions, bullets
         
         # Extract sections
@@ -449,40 +1019,14 @@ def parse_gemini_response(response_text: str, title_count: int, desc_count: int,
         else:
             bullets_section = ""
         
-        # Parse TITLES
-        for i in range(1, title_count + 1):
-            pattern = rf'Title\s*{i}\s*:\s*(.+?)(?=Title\s*{i+1}\s*:|DESCRIPTIONS:|$)'
-            match = re.search(pattern, titles_section, re.IGNORECASE | re.DOTALL)
-            if match:
-                content = ' '.join(match.group(1).strip().split())
-                if len(content) > 10:
-                    titles.append(content)
-                    print(f"   ✓ Title {i}: {content[:60]}...")
-        
-        # Parse DESCRIPTIONS
-        for i in range(1, desc_count + 1):
-            pattern = rf'Description\s*{i}\s*:\s*(.+?)(?=Description\s*{i+1}\s*:|BULLETS:|$)'
-            match = re.search(pattern, desc_section, re.IGNORECASE | re.DOTALL)
-            if match:
-                content = ' '.join(match.group(1).strip().split())
-                if len(content) > 20:
-                    descriptions.append(content)
-                    print(f"   ✓ Description {i}: {content[:60]}...")
-        
-        # Parse BULLETS
-        for i in range(1, bullet_count + 1):
-            pattern = rf'Bullet\s*{i}\s*:\s*(.+?)(?=Bullet\s*{i+1}\s*:|$)'
-            match = re.search(pattern, bullets_section, re.IGNORECASE | re.DOTALL)
-            if match:
-                content = ' '.join(match.group(1).strip().split())
-                if len(content) > 10:
-                    bullets.append(content)
-                    print(f"   ✓ Bullet {i}: {content[:60]}...")
+        titles = parse_numbered_items(titles_section, "Title", title_count, 10)
+        descriptions = parse_numbered_items(desc_section, "Description", desc_count, 20)
+        bullets = parse_numbered_items(bullets_section, "Bullet", bullet_count, 10)
         
         return titles, descriptions, bullets
         
     except Exception as e:
-        print(f"⚠️  Parsing error: {e}")
+        logger.warning(f"⚠️  Parsing error: {e}")
         return titles, descriptions, bullets
 
 
@@ -0,0 +1,52 @@
+from server import parse_gemini_response
+
+MARKDOWN_RESPONSE = """Here is the product content you asked for:
+
+**TITLES:**
+1. **Title 1:** Vichitra Silk Embroidered Kurta Set with Dupatta
+2. **Title 2:** Women's Embroidered Straight Kurta, Pant and Dupatta Set
+
+### **DESCRIPTIONS:**
+* **Description 1:** This vichitra silk kurta set features fine embroidery, a straight fit kurta and a matching 2.10 meter dupatta for festive wear.
+
+**BULLETS:**
+* **Bullet 1**: Premium Material: Crafted from rich vichitra silk for a smooth, elegant finish
+* **Bullet 2:** Comfortable Fit: Elasticated waistband pants with a slip-on closure
+"""
+
+
+def test_markdown_wrapped_markers():
+    titles, descriptions, bullets = parse_gemini_response(MARKDOWN_RESPONSE, 2, 1, 2)
+    assert titles == [
+        "Vichitra Silk Embroidered Kurta Set with Dupatta",
+        "Women's Embroidered Straight Kurta, Pant and Dupatta Set",
+    ]
+    assert descriptions == [
+        "This vichitra silk kurta set features fine embroidery, a straight fit kurta "
+        "and a matching 2.10 meter dupatta for festive wear.",
+    ]
+    assert bullets == [
+        "Premium Material: Crafted from rich vichitra silk for a smooth, elegant finish",
+        "Comfortable Fit: Elasticated waistband pants with a slip-on closure",
+    ]
+
+
+def test_flattened_items():
+    response = "TITLES: Title 1: Cotton kurta set Title 2: Silk kurta set DESCRIPTIONS: BULLETS:"
+    titles, _, _ = parse_gemini_response(response, 2, 0, 0)
+    assert titles == ["Cotton kurta set", "Silk kurta set"]
+
+
+def test_sentence_final_number_is_kept():
+    response = (
+        "TITLES:\nDESCRIPTIONS:\nBULLETS:\n"
+        "Bullet 1: Value bundle that comes in a pack of 2.\n"
+        "Bullet 2: Adjustable strap that fits 3.\n"
+        "Bullet 3: Machine washable cotton fabric"
+    )
+    _, _, bullets = parse_gemini_response(response, 0, 0, 3)
+    assert bullets == [
+        "Value bundle that comes in a pack of 2.",
+        "Adjustable strap that fits 3.",
+        "Machine washable cotton fabric",
+    ]